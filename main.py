@@ -1,4 +1,7 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import urllib3.util.connection
 import traceback
 from dotenv import load_dotenv
 import json
@@ -8,11 +11,132 @@ import logging
 import os
 import time
 import sys
-from argparse import ArgumentParser
-from typing import Optional, Dict, List
+import socket
+import threading
+import random
+import signal
+from argparse import ArgumentParser, ArgumentTypeError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from itertools import takewhile
+from typing import Optional, Dict, List, Tuple
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def send_email(msg: str, contacts: Dict, metadata: Dict, failure_type: int = 0) -> None:
+# Upper bound on concurrent probes. The connection pool is sized to match so
+# that no worker has to open a throwaway connection outside the pool.
+MAX_WORKERS = 32
+
+# Supported REST types, mapped to the HTTP method, the requests argument the
+# test data is passed as and the config field that data comes from.
+REST_METHODS = {
+    "get": ("GET", "params", "query_args"),
+    "post": ("POST", "json", "payload"),
+}
+
+# Status codes worth retrying. Other failures, client errors in particular,
+# are reported straight away since retrying them can't help. 429 is the one
+# client error that does clear up. Retry-After headers are ignored so a
+# server can't stall a run for longer than our own backoff allows.
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# Bytes of a failed response body included in the logs.
+PREVIEW_BYTES = 2048
+
+# Largest unread body worth draining to keep its connection alive. Anything
+# bigger, or of unknown length, is cheaper to drop along with the connection.
+DRAIN_LIMIT = 64 * 1024
+
+# Seconds a resolved host is reused before it is looked up again.
+DNS_CACHE_TTL = 900
+
+_DNS_CACHE: Dict[Tuple[str, int], Tuple[List[str], float]] = {}
+_DNS_CACHE_LOCK = threading.Lock()
+_create_connection = urllib3.util.connection.create_connection
+
+
+def _resolve(host: str, port: int) -> List[str]:
+    """Resolves a host to its addresses, reusing cached results until they
+    are older than DNS_CACHE_TTL.
+
+    Parameters
+    ----------
+    host: str
+        The host to resolve.
+    port: int
+        The port being connected to.
+
+    Returns
+    -------
+    list
+        The resolved addresses, in resolver order.
+    """
+    key = (host, port)
+    now = time.monotonic()
+    with _DNS_CACHE_LOCK:
+        cached = _DNS_CACHE.get(key)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+    addresses: List[str] = []
+    for *_, sockaddr in socket.getaddrinfo(
+        host,
+        port,
+        urllib3.util.connection.allowed_gai_family(),
+        socket.SOCK_STREAM,
+    ):
+        if sockaddr[0] not in addresses:
+            addresses.append(sockaddr[0])
+
+    with _DNS_CACHE_LOCK:
+        _DNS_CACHE[key] = (addresses, now + DNS_CACHE_TTL)
+    return addresses
+
+
+def _cached_create_connection(
+    address: Tuple[str, int], *args, **kwargs
+) -> socket.socket:
+    """Drop-in replacement for urllib3's create_connection that connects
+    through the DNS cache. The cache entry is dropped if none of the cached
+    addresses can be reached so a changed IP is picked up on the next attempt.
+
+    Parameters
+    ----------
+    address: tuple
+        The (host, port) to connect to.
+
+    Returns
+    -------
+    socket.socket
+        The connected socket.
+    """
+    host, port = address
+    if host.startswith("["):
+        host = host.strip("[]")
+
+    error: Optional[OSError] = None
+    for ip in _resolve(host, port):
+        try:
+            return _create_connection((ip, port), *args, **kwargs)
+        except OSError as e:
+            error = e
+
+    with _DNS_CACHE_LOCK:
+        _DNS_CACHE.pop((host, port), None)
+    if error is not None:
+        raise error
+    raise OSError(f"getaddrinfo returned no addresses for {host}")
+
+
+urllib3.util.connection.create_connection = _cached_create_connection
+
+
+def send_email(
+    msg: str, contacts: Dict, metadata: Dict, password: str, failure_type: int = 0
+) -> None:
     """Emails a message with failure reports.
 
     Parameters
@@ -23,14 +147,11 @@ def send_email(msg: str, contacts: Dict, metadata: Dict, failure_type: int = 0)
         The source and recipient contact info.
     metadata: dict
         The email metadata.
+    password: str
+        The email app password for the source account.
     failure_type: int, optional
         0 to send to all recipients, 1 to send just to script recipients.
     """
-    email_app_password = os.environ.get("EMAIL_APP_PASSWORD", None)
-    if email_app_password is None:
-        logging.error("Error grabbing email app password environment variable.")
-        sys.exit(1)
-
     recipients = (
         contacts["recipients"] if failure_type == 0 else contacts["script_recipient"]
     )
@@ -43,9 +164,7 @@ def send_email(msg: str, contacts: Dict, metadata: Dict, failure_type: int = 0)
 
     try:
         smtp_server = smtplib.SMTP_SSL("smtp.gmail.com", 465)
-        smtp_server.login(
-            user=contacts["source"]["account"], password=email_app_password
-        )
+        smtp_server.login(user=contacts["source"]["account"], password=password)
         smtp_server.sendmail(
             from_addr=email_message["From"],
             to_addrs=recipients,
@@ -53,98 +172,399 @@ def send_email(msg: str, contacts: Dict, metadata: Dict, failure_type: int = 0)
         )
         smtp_server.quit()
     except Exception as e:
-        logging.error(f"Error sending email: {e}\n{traceback.format_exc()}")
+        logging.error("Error sending email: %s", e, exc_info=True)
+
+
+class _BackoffRetry(Retry):
+    """urllib3 Retry that also waits before the first retry. The stock
+    get_backoff_time returns 0, and skips the jitter, until the second one.
+    """
+
+    def get_backoff_time(self) -> float:
+        """Returns the seconds to sleep before the next retry.
+
+        Returns
+        -------
+        float
+            backoff_factor * 2 ** (retries so far - 1) plus up to backoff_jitter,
+            capped at backoff_max.
+        """
+        consecutive_errors = len(
+            list(
+                takewhile(lambda x: x.redirect_location is None, reversed(self.history))
+            )
+        )
+        if consecutive_errors == 0:
+            return 0
+        backoff = self.backoff_factor * 2 ** (consecutive_errors - 1)
+        backoff += random.random() * self.backoff_jitter
+        return float(max(0, min(self.backoff_max, backoff)))
+
+
+def _build_session(max_retries: int = 3, retry_delay: int = 5) -> requests.Session:
+    """Builds a session shared by all the tests so connections are pooled
+    and kept alive between requests. Retries are handled by urllib3, only for
+    connection errors and server side status codes that can recover on their
+    own. The n-th retry waits retry_delay * 2 ** (n - 1) seconds plus up to
+    half a retry_delay of jitter.
+
+    Parameters
+    ----------
+    max_retries: int, optional
+        Maximum number of attempts for failed requests.
+    retry_delay: int, optional
+        Base delay in seconds for the backoff between retries.
+
+    Returns
+    -------
+    requests.Session
+        The configured session.
+    """
+    retries = _BackoffRetry(
+        total=max_retries - 1,
+        backoff_factor=retry_delay,
+        backoff_jitter=retry_delay / 2,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=[method for method, _, _ in REST_METHODS.values()],
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    # requests only speaks HTTP/1.1, so concurrent probes to one host each hold
+    # their own pooled connection rather than sharing a multiplexed one. With
+    # a handful of probes per host that costs a few extra handshakes per
+    # process, which daemon mode amortizes anyway.
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=retries
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _attempts(response: requests.Response) -> int:
+    """Returns how many attempts urllib3 made to get a response.
+
+    Parameters
+    ----------
+    response: requests.Response
+        The final response.
+
+    Returns
+    -------
+    int
+        The number of attempts, including the final one.
+    """
+    retries = getattr(response.raw, "retries", None)
+    return 1 + len(retries.history) if retries is not None else 1
+
+
+def _preview(response: requests.Response) -> str:
+    """Reads a bounded preview of a streamed response body and closes it.
+
+    Parameters
+    ----------
+    response: requests.Response
+        The streamed response.
+
+    Returns
+    -------
+    str
+        Up to PREVIEW_BYTES of the decoded body.
+    """
+    try:
+        preview = response.raw.read(PREVIEW_BYTES, decode_content=True)
+    except Exception:
+        preview = b""
+    finally:
+        response.close()
+
+    # same fallback as response.text for a missing or unknown charset
+    try:
+        return preview.decode(response.encoding or "utf-8", errors="replace")
+    except LookupError:
+        return preview.decode("utf-8", errors="replace")
+
+
+def _release(response: requests.Response) -> None:
+    """Hands a streamed response's connection back to the pool without
+    decoding the body.
+
+    Parameters
+    ----------
+    response: requests.Response
+        The streamed response.
+    """
+    length = response.headers.get("Content-Length", "")
+    if length.isdigit() and int(length) <= DRAIN_LIMIT:
+        response.raw.drain_conn()
+        response.raw.release_conn()
+    else:
+        response.close()
+
+
+def _run_single_test(
+    test_name: str, test_details: Dict, session: requests.Session, debug: bool = False
+) -> Optional[str]:
+    """Runs a single config test. Retries are handled by the session.
+
+    Parameters
+    ----------
+    test_name: str
+        The name of the test.
+    test_details: dict
+        The test structure.
+    session: requests.Session
+        The session to issue the requests through.
+    debug: bool, optional
+        Whether to also log success messages.
+
+    Returns
+    -------
+    str or None
+        None on success, a description of the test failure on a failure.
+    """
+    url = test_details["url"]
+    rest_type = test_details["type"]
+    accept_codes = test_details["accept"]
+    response = None
+
+    try:
+        if rest_type in REST_METHODS:
+            method, argument, field = REST_METHODS[rest_type]
+            response = session.request(
+                method,
+                url=url,
+                timeout=60,
+                stream=True,
+                **{argument: test_details.get(field, None)},
+            )
+        else:
+            logging.error("Unsupported REST type: `%s`.", rest_type)
+    except Exception as e:
+        # main logs the traceback when handling the error, repeat it only for debugging
+        logging.error(
+            "All retry attempts failed for `%s`: %s",
+            test_name,
+            e,
+            exc_info=logging.getLogger().isEnabledFor(logging.DEBUG),
+        )
+        raise
+
+    if response is not None and response.status_code in accept_codes:
+        # reading the body is only worth it if the success log will be emitted
+        if debug and logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info(
+                "Successfully completed test: %s (on attempt %d)\n"
+                "\tExpected one of: %s | Got: %d\nText: %s",
+                test_name,
+                _attempts(response),
+                sorted(accept_codes),
+                response.status_code,
+                response.text,
+            )
+        else:
+            _release(response)
+        return None
+
+    attempts = _attempts(response) if response is not None else 1
+    message = "\n".join(
+        [
+            f"Test `{test_name.replace('_', ' ')}` failed after {attempts} attempts",
+            f"\tURL: {url}",
+            f"\tExpected status codes: {sorted(accept_codes)}",
+            f"\tGot: {response.status_code if response is not None else 'No response'}",
+        ]
+    )
+    # the preview is always read since it also closes the response
+    logging.error(
+        "%s\nText: %s",
+        message,
+        _preview(response) if response is not None else "No text",
+    )
+    return message
 
 
 def run_tests(
-    tests: Dict, debug: bool = False, max_retries: int = 3, retry_delay: int = 5
+    tests: Dict,
+    debug: bool = False,
+    max_retries: int = 3,
+    retry_delay: int = 5,
+    session: Optional[requests.Session] = None,
 ) -> Optional[str]:
-    """Runs the config tests.
+    """Runs the config tests concurrently.
 
     Parameters
     ----------
     tests: dict
-        The test structures.
+        The test structures, as returned by _normalize_tests.
     debug: bool, optional
         Whether to also log success messages.
     max_retries: int, optional
-        Maximum number of retry attempts for failed requests.
+        Maximum number of attempts for failed requests.
     retry_delay: int, optional
-        Seconds to sleep between retries.
+        Base delay in seconds for the backoff between retries.
+    session: requests.Session, optional
+        A long lived session to run the tests through, its own retry settings
+        take precedence over max_retries and retry_delay. If not passed, a
+        session is built for just this run.
 
     Returns
     -------
     str or None
         None on success, a description of the test failures on a failure.
     """
-    error_messages: List[str] = []
-
-    for test_name, test_details in tests.items():
-
-        url = test_details["url"].strip()
-        rest_type = test_details["type"].lower().strip()
-        accept_codes = test_details["accept"]
-        args = None
-        response = None
-
-        for attempt in range(max_retries):
-            try:
-                if rest_type == "get":
-                    args = {"params": test_details.get("query_args", None)}
-                    response = requests.get(url=url, timeout=60, **args)
-                elif rest_type == "post":
-                    args = {"json": test_details.get("payload", None)}
-                    response = requests.post(url=url, timeout=60, **args)
-                else:
-                    logging.error(f"Unsupported REST type: `{rest_type}`.")
-                    continue
-
-                if response.status_code in accept_codes:
-                    if debug:
-                        message = f"Successfully completed test: {test_name} (on attempt {attempt + 1})\n"
-                        message += f"\tExpected one of: {accept_codes} | Got: {response.status_code}\n"
-                        message += f"Text: {str(response.text)}"
-                        logging.info(message)
-                    break
-
-                if attempt < max_retries - 1:
-                    logging.warning(
-                        f"Attempt {attempt + 1}/{max_retries} failed for {test_name}. "
-                        f"Status code: {response.status_code}. Retrying in {retry_delay} seconds..."
-                    )
-                    time.sleep(retry_delay)
-
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    logging.warning(
-                        f"Attempt {attempt + 1}/{max_retries} failed for {test_name} "
-                        f"with error: {str(e)}. Retrying in {retry_delay} seconds..."
-                        f"\n{traceback.format_exc()}"
-                    )
-                else:
-                    logging.error(
-                        f"All retry attempts failed for `{test_name}`: {e}\n{traceback.format_exc()}"
-                    )
-                    raise
-
-        if response is None or response.status_code not in accept_codes:
-            message = f"Test `{test_name.replace('_', ' ')}` failed after {max_retries} attempts\n"
-            message += f"\tURL: {url}\n"
-            message += f"\tExpected status codes: {accept_codes}\n"
-            message += f"\tGot: {response.status_code if response else 'No response'}"
-            error_messages.append(message)
-            logging.error(
-                f"{message}\nText: {str(response.text) if response else 'No text'}"
-            )
+    if not tests:
+        return None
+
+    error_messages: Dict[str, str] = {}
+
+    session_context = (
+        nullcontext(session)
+        if session is not None
+        else _build_session(max_retries, retry_delay)
+    )
+
+    with session_context as session, ThreadPoolExecutor(
+        max_workers=min(MAX_WORKERS, len(tests))
+    ) as executor:
+        futures = {
+            executor.submit(
+                _run_single_test,
+                test_name,
+                test_details,
+                session,
+                debug,
+            ): test_name
+            for test_name, test_details in tests.items()
+        }
+        for future in as_completed(futures):
+            message = future.result()
+            if message is not None:
+                error_messages[futures[future]] = message
 
     if error_messages:
-        return "\n".join(error_messages)
+        # keep the report in config order regardless of completion order
+        return "\n".join(
+            error_messages[test_name]
+            for test_name in tests
+            if test_name in error_messages
+        )
 
     return None
 
 
+def _normalize_tests(tests: Dict) -> Dict:
+    """Normalizes the config test structures once at load time so the test
+    runs don't have to.
+
+    Parameters
+    ----------
+    tests: dict
+        The test structures from the config file.
+
+    Returns
+    -------
+    dict
+        The tests with stripped URLs, lowercased REST types and the accepted
+        status codes as a frozenset for constant time lookups.
+    """
+    return {
+        test_name: {
+            "url": test_details["url"].strip(),
+            "type": test_details["type"].lower().strip(),
+            "accept": frozenset(test_details["accept"]),
+            "query_args": test_details.get("query_args", None),
+            "payload": test_details.get("payload", None),
+        }
+        for test_name, test_details in tests.items()
+    }
+
+
+def _check(
+    tests: Dict,
+    contacts: Dict,
+    email_metadata: Dict,
+    email_app_password: str,
+    session: requests.Session,
+    debug: bool = False,
+) -> bool:
+    """Runs the tests once and emails an alert if anything failed.
+
+    Parameters
+    ----------
+    tests: dict
+        The test structures, as returned by _normalize_tests.
+    contacts: dict
+        The source and recipient contact info.
+    email_metadata: dict
+        The email metadata.
+    email_app_password: str
+        The email app password for the source account.
+    session: requests.Session
+        The session to run the tests through.
+    debug: bool, optional
+        Whether to also log success messages.
+
+    Returns
+    -------
+    bool
+        True if the script itself encountered an error, False otherwise.
+    """
+    try:
+        test_results = run_tests(tests=tests, debug=debug, session=session)
+    except Exception as e:
+        # the alert email needs the traceback text anyway, so format it once
+        error_traceback = traceback.format_exc()
+        logging.error("Script encountered an error: %s\n%s", e, error_traceback)
+        send_email(
+            msg=f"Script error: {e}\n{error_traceback}",
+            contacts=contacts,
+            metadata=email_metadata,
+            password=email_app_password,
+            failure_type=1,
+        )
+        return True
+
+    if test_results is not None:
+        logging.warning("API or service tests failed. Sending alert email.")
+        send_email(
+            msg=test_results,
+            contacts=contacts,
+            metadata=email_metadata,
+            password=email_app_password,
+            failure_type=0,
+        )
+
+    return False
+
+
+def _positive_int(value: str) -> int:
+    """Argparse type for options that must be a whole number of at least 1.
+
+    Parameters
+    ----------
+    value: str
+        The raw command line value.
+
+    Returns
+    -------
+    int
+        The parsed value.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f"invalid int value: `{value}`")
+    if number < 1:
+        raise ArgumentTypeError(f"must be at least 1, got `{value}`")
+    return number
+
+
 def main() -> None:
 
+    load_dotenv()
+
     parser = ArgumentParser()
     parser.add_argument(
         "-p",
@@ -156,41 +576,71 @@ def main() -> None:
     parser.add_argument(
         "--debug", action="store_true", help="Whether to also log successes"
     )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and repeat the tests every --interval seconds",
+    )
+    parser.add_argument(
+        "--interval",
+        type=_positive_int,
+        default=300,
+        help="Seconds between test runs in daemon mode, defaults to 300.",
+    )
     options = parser.parse_args()
 
+    # resolved once up front so a missing password fails before any tests run
+    email_app_password = os.environ.get("EMAIL_APP_PASSWORD", None)
+    if email_app_password is None:
+        logging.error("Error grabbing email app password environment variable.")
+        sys.exit(1)
+
     try:
-        with open(options.path, "r") as f:
-            config = json.load(f)
+        with open(options.path, "rb") as f:
+            config = orjson.loads(f.read()) if orjson is not None else json.load(f)
     except Exception:
         print("Error opening config file.")
         sys.exit(1)
 
     contacts = config["contacts"]
-    tests = config["tests"]
+    tests = _normalize_tests(config["tests"])
     email_metadata = config["email_metadata"]
 
-    load_dotenv()
+    # the session, and with it the connection pool, lives as long as the process
+    session = _build_session()
 
-    try:
-        test_results = run_tests(tests=tests, debug=options.debug)
-        if test_results is not None:
-            logging.warning("API or service tests failed. Sending alert email.")
-            send_email(
-                msg=test_results,
-                contacts=contacts,
-                metadata=email_metadata,
-                failure_type=0,
-            )
+    if not options.daemon:
+        script_error = _check(
+            tests,
+            contacts,
+            email_metadata,
+            email_app_password,
+            session,
+            debug=options.debug,
+        )
+        session.close()
+        if script_error:
+            sys.exit(1)
+        return
 
-    except Exception as e:
-        logging.error(f"Script encountered an error: {e}\n{traceback.format_exc()}")
-        send_email(
-            msg=f"Script error: {e}\n{traceback.format_exc()}",
-            contacts=config["contacts"],
-            metadata=config["email_metadata"],
-            failure_type=1,
+    def _shutdown(signum, frame) -> None:
+        logging.info("Received signal %d, shutting down.", signum)
+        session.close()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    while True:
+        _check(
+            tests,
+            contacts,
+            email_metadata,
+            email_app_password,
+            session,
+            debug=options.debug,
         )
-        sys.exit(1)
+        time.sleep(options.interval)
 
 
 if __name__ == "__main__":